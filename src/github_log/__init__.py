@@ -1,12 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import urlencode
+import hashlib
+import json
 import os
+import time
+import queue
 import sys
+import threading
 import requests
 import argparse
 import re
 
 from zoneinfo import ZoneInfo
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PER_PAGE = 100
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "github-log")
+CACHE_TTL = 300
+UTC = ZoneInfo("UTC")
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+DATE_OFFSET_RE = re.compile(r"^-?\d+$")
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+# The GraphQL schema does not expose the REST events feed, so this queries the
+# closest equivalent: the contributions collection (commits, PRs, reviews,
+# issues) for the day, in a single request.
+GRAPHQL_ACTIVITY_QUERY = """
+query($from: DateTime!, $to: DateTime!) {
+  viewer {
+    contributionsCollection(from: $from, to: $to) {
+      commitContributionsByRepository(maxRepositories: 100) {
+        repository { nameWithOwner }
+        contributions(first: 100) { nodes { occurredAt commitCount } }
+      }
+      pullRequestContributions(first: 100) {
+        nodes { occurredAt pullRequest { title repository { nameWithOwner } } }
+      }
+      pullRequestReviewContributions(first: 100) {
+        nodes { occurredAt pullRequest { title repository { nameWithOwner } } }
+      }
+      issueContributions(first: 100) {
+        nodes { occurredAt issue { title repository { nameWithOwner } } }
+      }
+    }
+  }
+}
+"""
+
 
 class GitHubAPI:
     def __init__(self, access_token, orgs=""):
@@ -15,136 +60,310 @@ class GitHubAPI:
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/vnd.github.v3+json",
         }
-        self.current_user = self.get_current_user().get("login")
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount(
+            "https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        )
+        self.request_semaphore = threading.Semaphore(4)
+        token_hash = hashlib.sha256(access_token.encode()).hexdigest()[:12]
+        self.cache_file = os.path.join(CACHE_DIR, f"etags-{token_hash}.json")
+        self.cache_lock = threading.Lock()
+        self.etag_cache = self._load_etag_cache()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            user_future = executor.submit(self.get_current_user)
+            emails_future = executor.submit(self.get_current_user_emails)
+            self.current_user = user_future.result().get("login")
+            self.emails = emails_future.result()
         if orgs == "":
             self.orgs = []
         else:
             self.orgs = [o for o in orgs.split(",") if o != ""]
-        self.emails = self.get_current_user_emails()
+        self.emails_set = frozenset(self.emails)
+        self.local_tz = datetime.now().astimezone().tzinfo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._save_etag_cache()
+        self.session.close()
+
+    def _load_etag_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {
+            k: v
+            for k, v in cache.items()
+            if isinstance(v, dict) and "etag" in v and "content" in v
+        }
 
-    def get_current_user(self):
-        url = "https://api.github.com/user"
-        response = requests.get(url, headers=self.headers)
+    def _save_etag_cache(self):
+        try:
+            payload = json.dumps(self.etag_cache)
+        except (TypeError, ValueError):
+            return
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, "w") as f:
+                f.write(payload)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+
+    def _get(self, url, params=None, cached=False):
+        headers = {}
+        cache_key = None
+        entry = None
+        if cached:
+            cache_key = f"{url}?{urlencode(sorted(params.items()))}" if params else url
+            entry = self.etag_cache.get(cache_key)
+            if entry:
+                if time.time() - entry.get("fetched_at", 0) < CACHE_TTL:
+                    return self._decode(entry["content"])
+                headers["If-None-Match"] = entry["etag"]
+        with self.request_semaphore:
+            response = self.session.get(url, params=params, headers=headers)
+        if entry and response.status_code == 304:
+            with self.cache_lock:
+                entry["fetched_at"] = time.time()
+            return self._decode(entry["content"])
         response.raise_for_status()
-        return response.json()
+        body = self._decode(response.content)
+        if cached and response.headers.get("ETag"):
+            with self.cache_lock:
+                # cache the raw text, not the decoded objects: callers mutate
+                # the events they receive (e.g. created_at becomes a datetime)
+                self.etag_cache[cache_key] = {
+                    "etag": response.headers["ETag"],
+                    "content": response.text,
+                    "fetched_at": time.time(),
+                }
+        return body
+
+    @staticmethod
+    def _decode(content):
+        try:
+            return orjson.loads(content) if orjson else json.loads(content)
+        except ValueError as e:
+            raise requests.exceptions.RequestException(
+                f"Invalid JSON in response: {e}"
+            ) from e
+
+    def get_current_user(self):
+        return self._get("https://api.github.com/user")
 
     def get_current_user_emails(self):
-        url = "https://api.github.com/user/emails"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return [e["email"] for e in response.json()]
+        return [e["email"] for e in self._get("https://api.github.com/user/emails")]
 
     def get_user_events(self, page=1):
         url = f"https://api.github.com/users/{self.current_user}/events"
-        params = {"page": page}
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self._get(url, params={"page": page, "per_page": PER_PAGE}, cached=True)
 
     def get_org_events(self, org, page=1):
         url = f"https://api.github.com/users/{self.current_user}/events/orgs/{org}"
-        params = {"page": page}
-        response = requests.get(url, headers=self.headers, params=params)
-        response.raise_for_status()
-        return response.json()
+        return self._get(url, params={"page": page, "per_page": PER_PAGE}, cached=True)
 
     def get_orgs(self):
-        url = "https://api.github.com/user/orgs"
-        response = requests.get(url, headers=self.headers)
+        return self._get("https://api.github.com/user/orgs")
+
+    def get_graphql_activity(self, local_date):
+        start_dt, end_dt = self.get_date_bounds(local_date)
+        payload = {
+            "query": GRAPHQL_ACTIVITY_QUERY,
+            "variables": {"from": start_dt.isoformat(), "to": end_dt.isoformat()},
+        }
+        with self.request_semaphore:
+            response = self.session.post(GRAPHQL_URL, json=payload)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
+        if data.get("errors"):
+            message = "; ".join(e.get("message", "") for e in data["errors"])
+            raise requests.exceptions.RequestException(
+                f"GraphQL query failed: {message}"
+            )
+        collection = data["data"]["viewer"]["contributionsCollection"]
+
+        def occurred_at(node):
+            return datetime.fromisoformat(
+                node["occurredAt"].replace("Z", "+00:00")
+            ).astimezone(self.local_tz)
+
+        for by_repo in collection["commitContributionsByRepository"]:
+            repo = by_repo["repository"]["nameWithOwner"]
+            for node in by_repo["contributions"]["nodes"]:
+                yield (
+                    f"{occurred_at(node)} {self.current_user}/Push\t{repo}"
+                    f" - {node['commitCount']} commit(s)"
+                )
+        for node in collection["pullRequestContributions"]["nodes"]:
+            pr = node["pullRequest"]
+            yield (
+                f"{occurred_at(node)} {self.current_user}/PR"
+                f"\t{pr['repository']['nameWithOwner']} - {pr['title']}"
+            )
+        for node in collection["pullRequestReviewContributions"]["nodes"]:
+            pr = node["pullRequest"]
+            yield (
+                f"{occurred_at(node)} {self.current_user}/PR Review"
+                f"\t{pr['repository']['nameWithOwner']} - on PR {pr['title']}"
+            )
+        for node in collection["issueContributions"]["nodes"]:
+            issue = node["issue"]
+            yield (
+                f"{occurred_at(node)} {self.current_user}/Issue"
+                f"\t{issue['repository']['nameWithOwner']} - {issue['title']}"
+            )
 
-    def get_events_date(self, local_date, events_filter):
-        local_tz = datetime.now().astimezone().tzinfo
+    def get_date_bounds(self, local_date):
         start_dt = datetime.combine(local_date, datetime.min.time()).replace(
-            tzinfo=local_tz
+            tzinfo=self.local_tz
         )
         end_dt = datetime.combine(local_date, datetime.max.time()).replace(
-            tzinfo=local_tz
+            tzinfo=self.local_tz
         )
+        return start_dt, end_dt
 
-        events_filter = [e.lower() for e in events_filter.split(",") if e != ""]
+    def get_events_date(self, local_date, events_filter):
+        local_tz = self.local_tz
+        start_dt, end_dt = self.get_date_bounds(local_date)
 
-        yield from self.get_method_events_date(
-            local_tz, start_dt, end_dt, events_filter, self.get_user_events
-        )
-        for org in self.orgs:
+        events_filter = frozenset(e.lower() for e in events_filter.split(",") if e != "")
+
+        methods = [self.get_user_events] + [
+            lambda page, org=org: self.get_org_events(org, page) for org in self.orgs
+        ]
+        if len(methods) == 1:
             yield from self.get_method_events_date(
-                local_tz,
-                start_dt,
-                end_dt,
-                events_filter,
-                lambda page: self.get_org_events(org, page),
+                local_tz, start_dt, end_dt, events_filter, self.get_user_events
             )
+            return
 
-    def get_method_events_date(self, local_tz, start_dt, end_dt, events_filter, method):
-        page = 1
-        fetch_more = True
+        events_queue = queue.Queue()
+        done = object()
 
-        while fetch_more:
+        def drain(method):
             try:
-                events = method(page)
-            except requests.exceptions.RequestException as e:
-                print(f"Error fetching GitHub log: {e}", file=sys.stderr)
-                break
-            for event in events:
-                if (
-                    events_filter
-                    and event["type"].lower() not in events_filter
-                    and event["type"].replace("Event", "").lower() not in events_filter
+                for event in self.get_method_events_date(
+                    local_tz, start_dt, end_dt, events_filter, method
                 ):
-                    continue
-
-                logins = []
-                emails = []
-                find_user_logins(logins, emails, event)
-                if self.current_user not in logins and not set(
-                    self.emails
-                ).intersection(emails):
-                    continue
-
-                event_dt = (
-                    datetime.strptime(event["created_at"], "%Y-%m-%dT%H:%M:%SZ")
-                    .replace(tzinfo=ZoneInfo("UTC"))
-                    .astimezone(local_tz)
-                )
-
-                event["created_at"] = event_dt
-                if event_dt < start_dt:
-                    fetch_more = False
-                if start_dt <= event_dt <= end_dt:
+                    events_queue.put(event)
+            except Exception as e:
+                events_queue.put(e)
+            finally:
+                events_queue.put(done)
+
+        with ThreadPoolExecutor(max_workers=len(methods)) as executor:
+            for method in methods:
+                executor.submit(drain, method)
+            pending = len(methods)
+            while pending:
+                event = events_queue.get()
+                if event is done:
+                    pending -= 1
+                elif isinstance(event, Exception):
+                    raise event
+                else:
                     yield event
-            page += 1
 
+    def get_method_events_date(self, local_tz, start_dt, end_dt, events_filter, method):
+        prefetch = 4
+        page = 1
+        fetch_more = True
 
-def find_user_logins(logins, emails, event):
-    if not isinstance(event, dict):
-        return
-    for k, v in event.items():
-        if k == "login":
-            logins.append(v)
-        if k == "email":
-            emails.append(v)
-        elif isinstance(v, dict):
-            find_user_logins(logins, emails, v)
-        elif isinstance(v, list):
-            for item in v:
-                find_user_logins(logins, emails, item)
+        with ThreadPoolExecutor(max_workers=prefetch) as executor:
+            futures = {p: executor.submit(method, p) for p in range(1, prefetch + 1)}
+            while fetch_more:
+                try:
+                    events = futures.pop(page).result()
+                except requests.exceptions.RequestException as e:
+                    print(f"Error fetching GitHub log: {e}", file=sys.stderr)
+                    break
+                if not events:
+                    break
+                for event in events:
+                    if events_filter:
+                        event_type = event["type"]
+                        if (
+                            event_type.lower() not in events_filter
+                            and event_type.replace("Event", "").lower()
+                            not in events_filter
+                        ):
+                            continue
+
+                    # most events have the user as actor; check that one field
+                    # before scanning the whole payload
+                    if event.get("actor", {}).get("login") != self.current_user:
+                        if not event_matches_user(
+                            event, self.current_user, self.emails_set
+                        ):
+                            continue
+
+                    # created_at is always YYYY-MM-DDTHH:MM:SSZ; slicing is much
+                    # cheaper than strptime here
+                    s = event["created_at"]
+                    event_dt = datetime(
+                        int(s[0:4]),
+                        int(s[5:7]),
+                        int(s[8:10]),
+                        int(s[11:13]),
+                        int(s[14:16]),
+                        int(s[17:19]),
+                        tzinfo=UTC,
+                    ).astimezone(local_tz)
+
+                    event["created_at"] = event_dt
+                    if event_dt < start_dt:
+                        fetch_more = False
+                    if start_dt <= event_dt <= end_dt:
+                        yield event
+                page += 1
+                if fetch_more:
+                    next_page = page + len(futures)
+                    futures[next_page] = executor.submit(method, next_page)
+            for future in futures.values():
+                future.cancel()
+
+
+def event_matches_user(event, user, emails):
+    stack = [event]
+    while stack:
+        value = stack.pop()
+        value_type = type(value)
+        if value_type is dict:
+            for k, v in value.items():
+                if k == "login":
+                    if v == user:
+                        return True
+                elif k == "email":
+                    if v in emails:
+                        return True
+                else:
+                    stack.append(v)
+        elif value_type is list:
+            stack.extend(value)
+    return False
+
+
+PRETTY_EVENT_TYPES = {
+    "DeleteEvent": "Delete",
+    "PushEvent": "Push",
+    "PullRequestEvent": "PR",
+    "CreateEvent": "Create",
+    "ForkEvent": "Fork",
+    "ReleaseEvent": "Release",
+    "PullRequestReviewEvent": "PR Review",
+    "PullRequestReviewCommentEvent": "PR Comment",
+    "IssueCommentEvent": "Issue Comment",
+}
 
 
 def get_pretty_event_type(event):
-    switcher = {
-        "DeleteEvent": "Delete",
-        "PushEvent": "Push",
-        "PullRequestEvent": "PR",
-        "CreateEvent": "Create",
-        "ForkEvent": "Fork",
-        "ReleaseEvent": "Release",
-        "PullRequestReviewEvent": "PR Review",
-        "PullRequestReviewCommentEvent": "PR Comment",
-        "IssueCommentEvent": "Issue Comment",
-    }
-    return switcher.get(event["type"], event["type"])
+    return PRETTY_EVENT_TYPES.get(event["type"], event["type"])
 
 
 def get_prefix(event):
@@ -154,73 +373,65 @@ def get_prefix(event):
     return f"{event['created_at']} {event['actor']['login']}/{get_pretty_event_type(event)}\t{event['repo']['name']}"
 
 
-def push_formatter(logLines, event):
+def push_formatter(event):
+    prefix = get_prefix(event)
+    lines = []
     for commit in event["payload"]["commits"]:
-        logLines.append(f"{get_prefix(event)} - {commit['message'].replace('\n', ',')}")
+        message = commit["message"].replace("\n", ",")
+        lines.append(f"{prefix} - {message}")
+    return lines
 
 
-def pull_request_formatter(logLines, event):
-    logLines.append(
+def pull_request_formatter(event):
+    return [
         f"{get_prefix(event)} -{event['payload']['action']} - {event['payload']['pull_request']['title']}"
-    )
+    ]
 
 
-def create_formatter(logLines, event):
+def create_formatter(event):
     if event["payload"]["ref_type"] == "repository":
-        logLines.append(
+        return [
             f"{get_prefix(event)} - {event['payload']['ref_type']} {event['repo']['name']}"
-        )
-    else:
-        logLines.append(
-            f"{get_prefix(event)} - {event['payload']['ref_type']} {event['payload']['ref'] or ''}"
-        )
+        ]
+    return [
+        f"{get_prefix(event)} - {event['payload']['ref_type']} {event['payload']['ref'] or ''}"
+    ]
 
 
-def pull_request_review_comment_formatter(logLines, event):
-    logLines.append(
-        f"{get_prefix(event)} - on PR {event['payload']['pull_request']['title']}"
-    )
+def pull_request_review_comment_formatter(event):
+    return [f"{get_prefix(event)} - on PR {event['payload']['pull_request']['title']}"]
 
 
-def pull_request_review_formatter(logLines, event):
-    logLines.append(
-        f"{get_prefix(event)} - on PR {event['payload']['pull_request']['title']}"
-    )
+def pull_request_review_formatter(event):
+    return [f"{get_prefix(event)} - on PR {event['payload']['pull_request']['title']}"]
 
 
-def issue_comment_formatter(logLines, event):
-    logLines.append(
-        f"{get_prefix(event)} - on Issue {event['payload']['issue']['title']}"
-    )
+def issue_comment_formatter(event):
+    return [f"{get_prefix(event)} - on Issue {event['payload']['issue']['title']}"]
 
 
-def default_formatter(logLines, event):
-    logLines.append(f"{get_prefix(event)} - {event['payload']}")
+def default_formatter(event):
+    return [f"{get_prefix(event)} - {event['payload']}"]
 
 
-def activity_formatter(logLines, event):
-    switcher = {
-        "PushEvent": push_formatter,
-        "PullRequestEvent": pull_request_formatter,
-        "CreateEvent": create_formatter,
-        "DeleteEvent": create_formatter,
-        "PullRequestReviewEvent": pull_request_review_formatter,
-        "PullRequestReviewCommentEvent": pull_request_review_comment_formatter,
-        "IssueCommentEvent": issue_comment_formatter,
-    }
-    return switcher.get(event["type"], default_formatter)(logLines, event)
+EVENT_FORMATTERS = {
+    "PushEvent": push_formatter,
+    "PullRequestEvent": pull_request_formatter,
+    "CreateEvent": create_formatter,
+    "DeleteEvent": create_formatter,
+    "PullRequestReviewEvent": pull_request_review_formatter,
+    "PullRequestReviewCommentEvent": pull_request_review_comment_formatter,
+    "IssueCommentEvent": issue_comment_formatter,
+}
 
 
-def get_github_activity(gh, target_date, events_filter):
-    logLines = []
-    for event in gh.get_events_date(target_date, events_filter):
-        activity_formatter(logLines, event)
-    return logLines
+def format_event(event):
+    return EVENT_FORMATTERS.get(event["type"], default_formatter)(event)
 
 
-def print_activity(logLines):
-    for line in logLines:
-        print(line)
+def iter_github_activity(gh, target_date, events_filter):
+    for event in gh.get_events_date(target_date, events_filter):
+        yield from format_event(event)
 
 
 def main():
@@ -260,21 +471,36 @@ def main():
         help="Comma-separated list of organizations to include in the log",
     )
 
+    parser.add_argument(
+        "--graphql",
+        action="store_true",
+        help="Fetch the day's contributions (commits, PRs, reviews, issues) in a "
+        "single GraphQL query instead of paginating the REST events feed; "
+        "ignores --events and --orgs",
+    )
+
     args = parser.parse_args()
     token = args.token or os.getenv("GITHUB_TOKEN")
     if not token:
         print("Please set GITHUB_TOKEN environment variable")
         exit(1)
 
-    if re.match(r"^\d{4}-\d{2}-\d{2}$", args.date):
+    if DATE_RE.match(args.date):
         target_date = datetime.strptime(args.date, "%Y-%m-%d").date()
-    elif re.match(r"^-?\d+$", args.date):
+    elif DATE_OFFSET_RE.match(args.date):
         target_date = datetime.now().date() + timedelta(days=int(args.date))
+    else:
+        parser.error(f"invalid date {args.date!r}: expected YYYY-MM-DD or a day offset")
 
     try:
-        gh = GitHubAPI(token, args.orgs)
-        activity = get_github_activity(gh, target_date, args.events)
-        print_activity(activity)
+        with GitHubAPI(token, args.orgs) as gh:
+            if args.graphql:
+                lines = gh.get_graphql_activity(target_date)
+            else:
+                lines = iter_github_activity(gh, target_date, args.events)
+            for line in lines:
+                sys.stdout.write(line)
+                sys.stdout.write("\n")
     except requests.exceptions.RequestException as e:
         print(f"Error fetching GitHub log: {e}", file=sys.stderr)
         sys.exit(1)